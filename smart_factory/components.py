@@ -1,10 +1,13 @@
 import enum
 from collections import defaultdict
-from typing import List, Set, Optional
+from typing import List, Set, Optional, Tuple
 
 from ml_deeco.utils import verbosePrint
 from ml_deeco.simulation import StationaryComponent2D, MovingComponent2D, Component, Point2D, SIMULATION_GLOBALS
 
+# level of verbosePrint (set by helpers.setVerbosity), used to skip formatting of messages which would not be printed
+VERBOSE_LEVEL = 0
+
 
 class SecurityComponent(Component):
     """Base class for components with security rules (Door, Dispenser)."""
@@ -13,12 +16,13 @@ class SecurityComponent(Component):
         super().__init__()
         self.allowed = defaultdict(set)
 
-    def allow(self, subject, action):
-        self.allowed[action].add(subject)
+    def allowAll(self, subjects, action):
+        self.allowed[action].update(subjects)
 
     def allows(self, subject, action):
         actionAllowed = subject in self.allowed[action]
-        verbosePrint(f"{self}, {SIMULATION_GLOBALS.currentTimeStep + 1}: {'allowing' if actionAllowed else 'denying'} '{subject}' action '{action}'", 5)
+        if VERBOSE_LEVEL >= 5:
+            verbosePrint(f"{self}, {SIMULATION_GLOBALS.currentTimeStep + 1}: {'allowing' if actionAllowed else 'denying'} '{subject}' action '{action}'", 5)
         return actionAllowed
 
 
@@ -61,6 +65,7 @@ class Shift(Component):
         self.endTime = CONFIGURATION.shiftEnd
         self.assigned: Set['Worker'] = set(assigned)  # originally assigned for the shift
         self.standbys: Set['Worker'] = set(standbys)
+        self.roster: Tuple['Worker', ...] = (*assigned, *standbys)  # all assigned and standbys (both sets are fixed)
         self.cancelled: Set['Worker'] = set()
         self.calledStandbys: Set['Worker'] = set()
         self.workers: Set['Worker'] = set()  # actually working (subset of assigned and standbys)
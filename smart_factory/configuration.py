@@ -63,20 +63,18 @@ lateWeekEndBus = 15
 standbyMean, standbyStd = 30, 2
 
 
-def setArrivalTime(worker: Worker, dayOfWeek):
+def setArrivalTimes(workers: List[Worker], dayOfWeek):
     dayOfWeek = DayOfWeek(dayOfWeek % 7)
-    randomDelay = int(np.round(npr.exponential()))
+    randomDelays = np.round(npr.exponential(size=len(workers))).astype(int)
+    isLate = npr.random(len(workers)) < CONFIGURATION.latePercentage
 
     if dayOfWeek in (DayOfWeek.SATURDAY, DayOfWeek.SUNDAY):
-        if random.random() < CONFIGURATION.latePercentage:
-            worker.busArrivalTime = lateWeekEndBus + randomDelay
-        else:
-            worker.busArrivalTime = weekEndBus + randomDelay
+        busArrivalTimes = np.where(isLate, lateWeekEndBus, weekEndBus) + randomDelays
     else:
-        if random.random() < CONFIGURATION.latePercentage:
-            worker.busArrivalTime = lateWeekDayBus + randomDelay
-        else:
-            worker.busArrivalTime = weekDayBus + randomDelay
+        busArrivalTimes = np.where(isLate, lateWeekDayBus, weekDayBus) + randomDelays
+
+    for worker, busArrivalTime in zip(workers, busArrivalTimes):
+        worker.busArrivalTime = int(busArrivalTime)
 
 
 # we will not simulate the standby, just assume they will start working about an hour after they are called
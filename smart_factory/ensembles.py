@@ -6,7 +6,7 @@ from ml_deeco.simulation import Ensemble, someOf
 from ml_deeco.utils import verbosePrint
 
 from components import Shift, Worker, WorkerState
-from helpers import allow, now, DayOfWeek
+from helpers import allow, now, isVerbose, DayOfWeek
 
 
 class ShiftTeam(Ensemble):
@@ -21,12 +21,16 @@ class ShiftTeam(Ensemble):
     def priority(self):
         return 5
 
+    def situation(self):
+        # cancellations and called standbys change at most once per time step, so the set is not rebuilt per candidate
+        self.eligibleWorkers = (self.shift.assigned - self.shift.cancelled) | self.shift.calledStandbys
+        return True
+
     workers = someOf(Worker, selectedAllAtOnce=True)
 
     @workers.select
     def workers(self, worker, otherEnsembles):
-        return worker in (self.shift.assigned - self.shift.cancelled) or \
-            worker in self.shift.calledStandbys
+        return worker in self.eligibleWorkers
 
     def actuate(self):
         self.shift.workers = set(self.workers)
@@ -40,14 +44,15 @@ class AccessToFactory(Ensemble):
         super().__init__()
         self.shift = shift
         self.factory = shift.workPlace.factory
+        # the shift times do not change, so the time window of the situation is computed only once
+        self.activeFrom = shift.startTime - 30
+        self.activeTo = shift.endTime + 30
 
     def priority(self):
         return 4
 
     def situation(self):
-        startTime = self.shift.startTime
-        endTime = self.shift.endTime
-        return startTime - 30 <= now() <= endTime + 30
+        return self.activeFrom <= now() <= self.activeTo
 
     def actuate(self):
         allow(self.shift.workers, "enter", self.factory.entryDoor)
@@ -61,14 +66,14 @@ class AccessToDispenser(Ensemble):
         super().__init__()
         self.shift = shift
         self.dispenser = shift.workPlace.factory.dispenser
+        self.activeFrom = shift.startTime - 20
+        self.activeTo = shift.endTime
 
     def priority(self):
         return 4
 
     def situation(self):
-        startTime = self.shift.startTime
-        endTime = self.shift.endTime
-        return startTime - 20 <= now() <= endTime
+        return self.activeFrom <= now() <= self.activeTo
 
     def actuate(self):
         allow(self.shift.workers, "use", self.dispenser)
@@ -82,20 +87,24 @@ class AccessToWorkPlace(Ensemble):
         super().__init__()
         self.shift = shift
         self.workPlace = shift.workPlace
+        self.activeFrom = shift.startTime - 30
+        self.activeTo = shift.endTime + 30
 
     def priority(self):
         return 3
 
     def situation(self):
-        startTime = self.shift.startTime
-        endTime = self.shift.endTime
-        return startTime - 30 <= now() <= endTime + 30
+        if not self.activeFrom <= now() <= self.activeTo:
+            return False
+        # the workers pick up headgear only when they actuate, so the snapshot is valid for the whole time step
+        self.eligibleWorkers = {w for w in self.shift.workers if w.hasHeadGear}
+        return True
 
     workers = someOf(Worker, selectedAllAtOnce=True)  # subset of self.shift.workers
 
     @workers.select
     def workers(self, worker, otherEnsembles):
-        return worker in self.shift.workers and worker.hasHeadGear
+        return worker in self.eligibleWorkers
 
     def actuate(self):
         allow(self.workers, "enter", self.workPlace.entryDoor)
@@ -108,14 +117,15 @@ class CancelLateWorkers(Ensemble):
     def __init__(self, shift: Shift):
         super().__init__()
         self.shift = shift
+        self.notCancelled = self.shift.assigned - self.shift.cancelled  # updated in actuate
+        self.activeFrom = shift.startTime - 30
+        self.activeTo = shift.endTime
 
     def priority(self):
         return 2
 
     def situation(self):
-        startTime = self.shift.startTime
-        endTime = self.shift.endTime
-        return startTime - 30 <= now() <= endTime
+        return self.activeFrom <= now() <= self.activeTo
 
     # region late workers
 
@@ -143,7 +153,7 @@ class CancelLateWorkers(Ensemble):
     # @lateWorkers.estimate.conditionsValid
     @lateWorkers.estimate.targetsValid
     def belongsToShift(self, worker):
-        return worker in self.shift.assigned - self.shift.cancelled
+        return worker in self.notCancelled
 
     @lateWorkers.estimate.inputsValid
     def potentiallyLate(self, worker):
@@ -169,6 +179,7 @@ class CancelLateWorkers(Ensemble):
 
     def actuate(self):
         self.shift.cancelled.update(self.lateWorkers)
+        self.notCancelled = self.shift.assigned - self.shift.cancelled
         for worker in self.lateWorkers:
             worker.state = WorkerState.CANCELLED  # this is instead of the notification
 
@@ -201,7 +212,8 @@ class ReplaceLateWithStandbys(Ensemble):
         return 0, len(self.lateWorkersEnsemble.lateWorkers)
 
     def actuate(self):
-        verbosePrint(str(self.standbys), 5)
+        if isVerbose(5):
+            verbosePrint(str(self.standbys), 5)
         self.shift.calledStandbys.update(self.standbys)
         for standby in self.standbys:
             standby.state = WorkerState.CALLED_STANDBY  # this is instead of the notification of the standby
@@ -1,16 +1,29 @@
 import enum
 
 from ml_deeco.simulation import SIMULATION_GLOBALS
-from ml_deeco.utils import verbosePrint
+from ml_deeco.utils import verbosePrint, setVerboseLevel
+
+import components
 from components import SecurityComponent
 
 
 def allow(subjects, action, object: SecurityComponent):
-    subjects = list(subjects)
-    for s in subjects:
-        object.allow(s, action)
-    if len(subjects) > 0:
-        verbosePrint(f"Allowing {subjects} '{action}' '{object}'", 6)
+    object.allowAll(subjects, action)
+    if components.VERBOSE_LEVEL >= 6:
+        subjects = list(subjects)
+        if len(subjects) > 0:
+            verbosePrint(f"Allowing {subjects} '{action}' '{object}'", 6)
+
+
+def setVerbosity(level):
+    """Sets the level of verbosePrint together with components.VERBOSE_LEVEL checked by isVerbose."""
+    setVerboseLevel(level)
+    components.VERBOSE_LEVEL = level
+
+
+def isVerbose(level):
+    """Whether messages of the given level are printed (check before formatting costly messages)."""
+    return components.VERBOSE_LEVEL >= level
 
 
 def now():
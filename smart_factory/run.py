@@ -2,7 +2,7 @@ import argparse
 import os
 import random
 from pathlib import Path
-from typing import List
+from typing import List, TYPE_CHECKING
 import numpy as np
 
 os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")  # Report only TF errors by default
@@ -11,24 +11,45 @@ import tensorflow as tf
 
 from ml_deeco.estimators import NeuralNetworkEstimator
 from ml_deeco.simulation import Component, run_experiment, SIMULATION_GLOBALS
-from ml_deeco.utils import setVerboseLevel, verbosePrint, Log, setVerbosePrintFile, AverageLog
+from ml_deeco.utils import verbosePrint, Log, setVerbosePrintFile, AverageLog
 
-from configuration import CONFIGURATION, createFactory, setArrivalTime
-from components import Shift, Worker
-from helpers import DayOfWeek
+from configuration import CONFIGURATION, createFactory, setArrivalTimes
+from components import Shift, Worker, WorkerState
+from helpers import DayOfWeek, setVerbosity, isVerbose
 from plots import plotStandbysAndLateness, plotLateWorkersNN
 
+if TYPE_CHECKING:
+    from ensembles import CancelLateWorkers  # imported in run() at runtime
 
-arrivedAtWorkplaceTimeAvgTimes = []
-workerLogs = {}
+
+# sum and count of the average arrival times of shifts in the current iteration
+arrivedAtWorkplaceTimeAvgSum = 0.0
+arrivedAtWorkplaceTimeAvgCount = 0
+# positions and states of all workers in each step of the current simulation (rows = steps, columns = workers)
+workerLogDtype = np.dtype([("x", "i4"), ("y", "i4"), ("state", "i1"), ("isAtFactory", "?"), ("hasHeadGear", "?")])
+workerLogs: np.ndarray
 cancelledWorkersLog: Log
+# components and ensembles of the current simulation partitioned by type (set in prepareSimulation)
+simulationWorkers: List[Worker] = []
+simulationShifts: List[Shift] = []
+cancelLateWorkersEnsembles: List['CancelLateWorkers'] = []
 shiftsLog = AverageLog(["iteration", "simulation", "shift", "arrived", "standbys", "avg_work_start_time", "lateness"])
 
 
-def computeLateness(workers):
+def computeLateness(arrivalTimes: np.ndarray):
     """Mean of square of delay of workers which arrive late."""
-    arrivalTimes = np.array([w.arrivedAtWorkplaceTime for w in workers])
-    return float(np.mean(np.max(arrivalTimes - CONFIGURATION.shiftStart, 0) ** 2))
+    delays = arrivalTimes - CONFIGURATION.shiftStart
+    np.maximum(delays, 0, out=delays)
+    return float(np.dot(delays, delays) / delays.size)
+
+
+def configureTensorFlow(args):
+    """Sets the random seed and number of threads of TF."""
+    tf.random.set_seed(args.seed)
+
+    # Set number of threads (the NN is small, parallelize only inside the ops to avoid two levels of thread pools)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+    tf.config.threading.set_intra_op_parallelism_threads(args.threads)
 
 
 def run(args):
@@ -36,11 +57,7 @@ def run(args):
     # Fix random seeds
     random.seed(args.seed)
     np.random.seed(args.seed)
-    tf.random.set_seed(args.seed)
-
-    # Set number of threads
-    tf.config.threading.set_inter_op_parallelism_threads(args.threads)
-    tf.config.threading.set_intra_op_parallelism_threads(args.threads)
+    configureTensorFlow(args)
 
     # initialize output path
     CONFIGURATION.outputFolder = Path(args.output_folder)
@@ -56,70 +73,86 @@ def run(args):
     )
 
     # initialize verbose printing
-    setVerboseLevel(args.verbose)
+    setVerbosity(args.verbose)
     setVerbosePrintFile(outputFile)
 
     from ensembles import getEnsembles, CancelLateWorkers
 
     def prepareSimulation(_i, simulation):
         """Prepares the components and ensembles for the simul """
-        global workerLogs, cancelledWorkersLog
-        workerLogs = {}
+        global workerLogs, cancelledWorkersLog, simulationWorkers, simulationShifts, cancelLateWorkersEnsembles
         cancelledWorkersLog = Log(["time", "worker", "bus_arrival", "shift"])
 
         CONFIGURATION.dayOfWeek = DayOfWeek(simulation)
 
         components: List[Component] = []
         shifts = []
+        allWorkers = []
 
         factory, workplaces, busStop = createFactory()
         components.append(factory)
 
         for workplace in workplaces:
             workers = [Worker(workplace, busStop) for _ in range(CONFIGURATION.workersPerShift)]
-            for worker in workers:
-                setArrivalTime(worker, simulation)
+            setArrivalTimes(workers, simulation)
             standbys = [Worker(workplace, busStop) for _ in range(CONFIGURATION.standbysPerShift)]
             shift = Shift(workplace, workers, standbys)
             components += [workplace, shift, *workers, *standbys]
             shifts.append(shift)
+            allWorkers += [*workers, *standbys]
+
+        if args.log_workers:
+            workerLogs = np.zeros((CONFIGURATION.steps, len(allWorkers)), dtype=workerLogDtype)
 
-            if args.log_workers:
-                for worker in workers + standbys:
-                    workerLogs[worker] = Log(["x", "y", "state", "isAtFactory", "hasHeadGear"])
+        ensembles = getEnsembles(shifts)
+        simulationWorkers = allWorkers
+        simulationShifts = shifts
+        cancelLateWorkersEnsembles = [e for e in ensembles if isinstance(e, CancelLateWorkers)]
 
-        return components, getEnsembles(shifts)
+        return components, ensembles
 
-    def stepCallback(components, ensembles, step):
-        for cancelled in filter(lambda c: isinstance(c, CancelLateWorkers), ensembles):
+    def stepCallback(_components, _ensembles, step):
+        for cancelled in cancelLateWorkersEnsembles:
+            if not cancelled.materialized:
+                continue
             for worker in cancelled.lateWorkers:
                 cancelledWorkersLog.register([step, worker, worker.busArrivalTime, cancelled.shift])
 
         if args.log_workers:
-            for worker in filter(lambda c: isinstance(c, Worker), components):
-                workerLogs[worker].register([int(worker.location.x), int(worker.location.x), worker.state, worker.isAtFactory, worker.hasHeadGear])
+            stepLogs = workerLogs[step]
+            for index, worker in enumerate(simulationWorkers):
+                location = worker.location
+                stepLogs[index] = (int(location.x), int(location.y), worker.state, worker.isAtFactory, worker.hasHeadGear)
 
-    def simulationCallback(components, _ens, i, s):
+    def simulationCallback(_components, _ens, i, s):
+        global arrivedAtWorkplaceTimeAvgSum, arrivedAtWorkplaceTimeAvgCount
         workersLog = Log(["worker", "shift", "state", "isAtFactory", "hasHeadGear", "busArrivalTime", "arrivedAtFactoryTime",
                           "arrivedAtWorkplaceTime"])
 
-        shifts = filter(lambda c: isinstance(c, Shift), components)
-        for shift in shifts:
-            arrivedWorkers = list(filter(lambda w: w.arrivedAtWorkplaceTime is not None, shift.workers))
-            avgArriveTime = sum(map(lambda w: w.arrivedAtWorkplaceTime, arrivedWorkers)) / len(arrivedWorkers)
-            arrivedAtWorkplaceTimeAvgTimes.append(avgArriveTime)
+        for shift in simulationShifts:
+            arrivalTimes = np.fromiter((w.arrivedAtWorkplaceTime for w in shift.workers if w.arrivedAtWorkplaceTime is not None), dtype=np.float64)
+            if arrivalTimes.size > 0:
+                avgArriveTime = float(arrivalTimes.mean())
+                lateness = computeLateness(arrivalTimes)
+                arrivedAtWorkplaceTimeAvgSum += avgArriveTime
+                arrivedAtWorkplaceTimeAvgCount += 1
+            else:
+                # nobody arrived, the shift is still logged but left out of the iteration average
+                avgArriveTime = lateness = float("nan")
             standbysCount = len(shift.calledStandbys)
-            verbosePrint(f"{shift}: arrived {len(arrivedWorkers)} workers ({standbysCount} standbys), avg. time = {avgArriveTime:.2f}, lateness = {computeLateness(arrivedWorkers):.0f}", 2)
-            shiftsLog.register([i + 1, s + 1, str(shift), len(arrivedWorkers), standbysCount, avgArriveTime, computeLateness(arrivedWorkers)])
+            if isVerbose(2):
+                verbosePrint(f"{shift}: arrived {arrivalTimes.size} workers ({standbysCount} standbys), avg. time = {avgArriveTime:.2f}, lateness = {lateness:.0f}", 2)
+            shiftsLog.register([i + 1, s + 1, str(shift), arrivalTimes.size, standbysCount, avgArriveTime, lateness])
 
-            for worker in shift.assigned | shift.standbys:
+            for worker in shift.roster:
                 workersLog.register([worker, shift, worker.state, worker.isAtFactory, worker.hasHeadGear, worker.busArrivalTime, worker.arrivedAtFactoryTime, worker.arrivedAtWorkplaceTime])
         shiftsLog.registerAvg()
 
-        workersAtFactory = list(filter(lambda c: isinstance(c, Worker) and c.arrivedAtFactoryTime is not None, components))
-        if workersAtFactory:
-            avgFactoryArrivalTime = sum(map(lambda w: w.arrivedAtFactoryTime, workersAtFactory)) / len(workersAtFactory)
-            verbosePrint(f"Average arrival at factory = {avgFactoryArrivalTime:.2f}", 2)
+        factoryArrivalTimes = [w.arrivedAtFactoryTime for w in simulationWorkers if w.arrivedAtFactoryTime is not None]
+        if factoryArrivalTimes:
+            avgFactoryArrivalTime = sum(factoryArrivalTimes) / len(factoryArrivalTimes)
+            if isVerbose(2):
+                verbosePrint(f"Average arrival at factory = {avgFactoryArrivalTime:.2f}", 2)
 
         os.makedirs(CONFIGURATION.outputFolder / f"cancelled_workers/{i + 1}/", exist_ok=True)
         cancelledWorkersLog.export(CONFIGURATION.outputFolder / f"cancelled_workers/{i + 1}/{s + 1}.csv")
@@ -129,19 +162,27 @@ def run(args):
 
         if args.log_workers:
             os.makedirs(CONFIGURATION.outputFolder / f"all_workers/{i+1}/{s+1}", exist_ok=True)
-            for worker in filter(lambda c: isinstance(c, Worker), components):
-                workerLogs[worker].export(CONFIGURATION.outputFolder / f"all_workers/{i+1}/{s+1}/{worker}.csv")
+            for index, worker in enumerate(simulationWorkers):
+                # exported through Log to keep the format of the CSV files (enum states, True/False flags)
+                workerLog = Log(list(workerLogDtype.names))
+                for x, y, state, isAtFactory, hasHeadGear in workerLogs[:, index].tolist():
+                    workerLog.register([x, y, WorkerState(state), isAtFactory, hasHeadGear])
+                workerLog.export(CONFIGURATION.outputFolder / f"all_workers/{i+1}/{s+1}/{worker}.csv")
 
     def iterationCallback(i):
-        global arrivedAtWorkplaceTimeAvgTimes
-        avgTimesAverage = sum(arrivedAtWorkplaceTimeAvgTimes) / len(arrivedAtWorkplaceTimeAvgTimes)
-        verbosePrint(f"Average arrival time in the iteration: {avgTimesAverage:.2f}", 1)
-        arrivedAtWorkplaceTimeAvgTimes = []
+        global arrivedAtWorkplaceTimeAvgSum, arrivedAtWorkplaceTimeAvgCount
+        if arrivedAtWorkplaceTimeAvgCount > 0:
+            avgTimesAverage = arrivedAtWorkplaceTimeAvgSum / arrivedAtWorkplaceTimeAvgCount
+            verbosePrint(f"Average arrival time in the iteration: {avgTimesAverage:.2f}", 1)
+        arrivedAtWorkplaceTimeAvgSum = 0.0
+        arrivedAtWorkplaceTimeAvgCount = 0
 
         # save the NN
         CONFIGURATION.lateWorkersNN.saveModel(str(i + 1))
         plotLateWorkersNN(CONFIGURATION.lateWorkersNN, CONFIGURATION.outputFolder / f"nn_{i + 1}.png", f"Iteration {i + 1}", show=args.show_plots)
 
+    # The simulations are run sequentially in this process: the estimators collect their training data from all simulations
+    # of an iteration and are trained between the iterations, so the simulations cannot be moved to worker processes.
     run_experiment(args.iterations, 7, CONFIGURATION.steps, prepareSimulation,
                    stepCallback=stepCallback, simulationCallback=simulationCallback, iterationCallback=iterationCallback)
     outputFile.close()
@@ -154,7 +195,7 @@ def main():
     parser = argparse.ArgumentParser(description='Smart factory simulation')
     parser.add_argument('-v', '--verbose', type=int, help='the verboseness between 0 and 4.', required=False, default="0")
     parser.add_argument('-s', '--seed', type=int, help='Random seed.', required=False, default=42)
-    parser.add_argument('--threads', type=int, help='Number of CPU threads TF can use.', required=False, default=4)
+    parser.add_argument('--threads', type=int, help='Number of CPU threads TF can use inside one operation.', required=False, default=4)
     parser.add_argument('-o', '--output_folder', type=str, help='Output folder for the logs.', required=True, default='results')
     parser.add_argument('-w', '--log_workers', action='store_true', help='Save logs of all workers.', required=False, default=False)
     parser.add_argument('-b', '--baseline', type=int, help="Cancel missing workers 'baseline' minutes before the shift starts.", required=False, default=16)